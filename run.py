@@ -1,11 +1,13 @@
 # /Users/dag/projects/karaoke/run.py
 from __future__ import annotations
 
-import subprocess
 import json
 import sys
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
 
+from scripts import fetch_audio, fetch_lyrics
+
 
 DEFAULT_URL = "https://www.youtube.com/watch?v=1gfdp6V1Epc"
 PROJECT_ROOT = Path(__file__).resolve().parent
@@ -22,21 +24,32 @@ def resolve_url() -> str:
     return entered if entered else DEFAULT_URL
 
 
-def run(cmd: list[str]) -> None:
-    completed = subprocess.run(cmd, cwd=PROJECT_ROOT)
-    if completed.returncode != 0:
-        raise SystemExit(completed.returncode)
-
-
 def main() -> None:
     url = resolve_url()
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-    print("Downloading audio (MP3)...")
-    run([sys.executable, str(PROJECT_ROOT / "scripts" / "fetch_audio.py"), url])
+    # Audio (network + ffmpeg) and captions (small HTTP fetches) are independent,
+    # so run them side by side; both block outside the GIL.
+    print("Downloading audio (MP3) and fetching lyrics (words + sentences)...")
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        audio_fut = pool.submit(fetch_audio.download_audio_mp3, url, OUTPUT_DIR / "song")
+        lyrics_fut = pool.submit(fetch_lyrics.write_lyrics, url, OUTPUT_DIR)
+        wait([audio_fut, lyrics_fut])
 
-    print("Fetching lyrics (words + sentences)...")
-    run([sys.executable, str(PROJECT_ROOT / "scripts" / "fetch_lyrics.py"), url])
+    try:
+        mp3_path = audio_fut.result()
+    except Exception as e:
+        print(f"ERROR: audio download failed: {e}")
+        raise SystemExit(1)
+    print(f"Saved MP3: {mp3_path}")
+
+    try:
+        rc = lyrics_fut.result()
+    except Exception as e:
+        print(f"ERROR: lyrics fetch failed: {e}")
+        raise SystemExit(1)
+    if rc != 0:
+        raise SystemExit(rc)
 
     print("All outputs generated.")
 
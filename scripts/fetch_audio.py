@@ -1,20 +1,50 @@
 # /Users/dag/projects/karaoke/scripts/fetch_audio.py
 from __future__ import annotations
 
+import os
+import re
+import shutil
 import sys
 from pathlib import Path
+from typing import Optional
 
-import yt_dlp
+# Ensure repository root is on sys.path when running directly
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.fetch_lyrics import extract_video_id  # noqa: E402
 
 
 DEFAULT_URL = "https://www.youtube.com/watch?v=1gfdp6V1Epc"
-PROJECT_ROOT = Path(__file__).resolve().parents[1]
 OUTPUT_DIR = PROJECT_ROOT / "output"
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+AUDIO_CACHE_DIR = PROJECT_ROOT / ".cache" / "audio"
+_CACHEABLE_ID_RE = re.compile(r"[A-Za-z0-9_-]{11}")
+
+
+def _audio_cache_path(url: str) -> Optional[Path]:
+    # Only cache when a real video ID was extracted; other URL shapes fall back to the full URL
+    vid = extract_video_id(url)
+    if not _CACHEABLE_ID_RE.fullmatch(vid):
+        return None
+    return AUDIO_CACHE_DIR / f"{vid}.mp3"
 
 
 def download_audio_mp3(url: str, target_path: Path) -> Path:
-    """Download best audio and save as MP3 to target_path (overwrites)."""
+    """Download best audio and save as MP3 to target_path (overwrites).
+
+    The MP3 is cached by video ID, so re-runs for the same video skip yt-dlp entirely.
+    """
+    final_mp3 = target_path.with_suffix(".mp3")
+    cache_path = _audio_cache_path(url)
+    if cache_path is not None and cache_path.exists():
+        shutil.copyfile(cache_path, final_mp3)
+        return final_mp3
+
+    # Import lazily: yt-dlp loads hundreds of extractors, which cached runs never need
+    import yt_dlp
+
     # Use yt-dlp to fetch bestaudio and convert to mp3 via ffmpeg
     # We set outtmpl to the target base name; postprocessor will output mp3
     outtmpl = str(target_path.with_suffix(".%(ext)s"))
@@ -25,6 +55,8 @@ def download_audio_mp3(url: str, target_path: Path) -> Path:
         "quiet": True,
         "no_warnings": True,
         "overwrites": True,
+        # Fetch DASH fragments in parallel instead of one at a time
+        "concurrent_fragment_downloads": 5,
         "postprocessors": [
             {
                 "key": "FFmpegExtractAudio",
@@ -37,9 +69,19 @@ def download_audio_mp3(url: str, target_path: Path) -> Path:
     with yt_dlp.YoutubeDL(ydl_opts) as ydl:
         ydl.download([url])
 
-    final_mp3 = target_path.with_suffix(".mp3")
     if not final_mp3.exists():
         raise FileNotFoundError(f"Expected MP3 not found at {final_mp3}")
+
+    if cache_path is not None:
+        # Copy into the cache via a temp name so a partial copy is never picked up;
+        # best-effort, a read-only or full disk must not fail a finished download
+        try:
+            AUDIO_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            tmp = cache_path.with_name(cache_path.name + ".tmp")
+            shutil.copyfile(final_mp3, tmp)
+            os.replace(tmp, cache_path)
+        except OSError:
+            pass
     return final_mp3
 
 
@@ -59,5 +101,3 @@ def main() -> None:
 
 if __name__ == "__main__":
     main()
-
-
@@ -1,34 +1,59 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
-import json
 import os
 import re
 import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from operator import itemgetter
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
+from xml.parsers import expat
 
 import requests
 
+# orjson parses bytes directly and is several times faster on large json3 payloads;
+# stdlib json also accepts UTF-8 bytes, so it is a drop-in fallback.
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
 OUTPUT_DIR = REPO_ROOT / "output"
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+CAPTIONS_CACHE_DIR = REPO_ROOT / ".cache" / "captions"
+
+# How long a preferred caption format gets before the next one is requested as a hedge
+CAPTION_HEDGE_DELAY_S = 1.5
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+
+# One pooled keep-alive session for the watch page, youtubei and timedtext calls,
+# so later requests reuse the TCP+TLS connection to www.youtube.com.
+# requests already advertises gzip/deflate and decodes transparently.
+SESSION = requests.Session()
+SESSION.headers.update({"User-Agent": USER_AGENT})
+
+_VIDEO_ID_RE = re.compile(r"(?:v=|youtu\.be/|youtube\.com/watch\?v=)([A-Za-z0-9_-]{6,})")
+_INNERTUBE_KEY_RE = re.compile(r'"INNERTUBE_API_KEY"\s*:\s*"([^"]+)"')
+_INNERTUBE_CLIENT_RE = re.compile(r'"INNERTUBE_CLIENT_NAME"\s*:\s*"([^"]+)"')
+_INNERTUBE_VERSION_RE = re.compile(r'"INNERTUBE_CLIENT_VERSION"\s*:\s*"([^"]+)"')
 
 
 def extract_video_id(s: str) -> str:
-    m = re.search(r"(?:v=|youtu\.be/|youtube\.com/watch\?v=)([A-Za-z0-9_-]{6,})", s)
+    m = _VIDEO_ID_RE.search(s)
     return m.group(1) if m else s.strip()
 
 
 def _fetch_watch_html(video_id: str) -> Optional[str]:
     headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
         "Accept-Language": "th,en-US;q=0.9,en;q=0.8",
     }
     url = f"https://www.youtube.com/watch?v={video_id}"
     try:
-        r = requests.get(url, headers=headers, timeout=30)
+        r = SESSION.get(url, headers=headers, timeout=30)
         r.raise_for_status()
         return r.text
     except Exception:
@@ -36,12 +61,12 @@ def _fetch_watch_html(video_id: str) -> Optional[str]:
 
 
 def _extract_innertube_keys(html: str) -> Optional[Tuple[str, str, str]]:
-    key_m = re.search(r'"INNERTUBE_API_KEY"\s*:\s*"([^"]+)"', html)
+    key_m = _INNERTUBE_KEY_RE.search(html)
     if not key_m:
         return None
     key = key_m.group(1)
-    client_m = re.search(r'"INNERTUBE_CLIENT_NAME"\s*:\s*"([^"]+)"', html)
-    ver_m = re.search(r'"INNERTUBE_CLIENT_VERSION"\s*:\s*"([^"]+)"', html)
+    client_m = _INNERTUBE_CLIENT_RE.search(html)
+    ver_m = _INNERTUBE_VERSION_RE.search(html)
     client = client_m.group(1) if client_m else "WEB"
     version = ver_m.group(1) if ver_m else "2.20240901.00.00"
     return key, client, version
@@ -56,7 +81,6 @@ def fetch_captiontracks_via_youtubei(video_id: str, hl: str = 'th', gl: str = 'T
         return []
     api_key, client_name, client_version = kc
     headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
         "Accept-Language": f"{hl},en-US;q=0.9,en;q=0.8",
         "Content-Type": "application/json",
     }
@@ -73,7 +97,7 @@ def fetch_captiontracks_via_youtubei(video_id: str, hl: str = 'th', gl: str = 'T
     }
     api_url = f"https://www.youtube.com/youtubei/v1/player?key={api_key}"
     try:
-        pr = requests.post(api_url, headers=headers, json=body, timeout=30)
+        pr = SESSION.post(api_url, headers=headers, json=body, timeout=30)
         pr.raise_for_status()
         data = pr.json()
     except Exception:
@@ -90,136 +114,223 @@ def pick_track(tracks: List[Dict], lang: str = 'th') -> Optional[Dict]:
     def score(t: Dict) -> Tuple[int, int, int]:
         code = t.get("languageCode") or t.get("vssId") or ""
         exact = 1 if code == lang else 0
-        prefix = 1 if (lang and str(code).startswith(lang)) else 0
+        prefix = 1 if (lang and code.startswith(lang)) else 0
         asr = 1 if t.get("kind") == "asr" or (t.get("vssId") or "").startswith("a.") else 0
         return (exact, prefix, asr)
     if not tracks:
         return None
-    return sorted(tracks, key=score, reverse=True)[0]
+    return max(tracks, key=score)
+
+
+def _fetch_caption_fmt(base_url: str, fmt: str) -> Optional[bytes]:
+    """GET one caption format; return the body if it looks usable, else None."""
+    url = base_url
+    if "fmt=" not in url:
+        sep = "&" if "?" in url else "?"
+        url = f"{url}{sep}fmt={fmt}"
+    if fmt == "json3" and "xorb=" not in url:
+        url += "&xorb=2&xobt=3&xovt=3"
+    try:
+        r = SESSION.get(url, timeout=30)
+    except requests.RequestException:
+        return None
+    if r.status_code != 200 or not r.content:
+        return None
+    body = r.content.lstrip()
+    if fmt == "json3":
+        if body.startswith(b")]}\'\n"):
+            body = body.split(b"\n", 1)[1]
+        if b"\"events\"" in body or b"events" in body:
+            return r.content
+    else:
+        if b"<p " in body:
+            return r.content
+    return None
 
 
 def download_caption(base_url: str, prefer: Tuple[str, ...] = ("json3", "srv3")) -> Tuple[str, bytes]:
-    headers = {"User-Agent": "Mozilla/5.0"}
-    for fmt in prefer:
-        url = base_url
-        if "fmt=" not in url:
-            sep = "&" if "?" in url else "?"
-            url = f"{url}{sep}fmt={fmt}"
-        if fmt == "json3" and "xorb=" not in url:
-            url += "&xorb=2&xobt=3&xovt=3"
-        r = requests.get(url, headers=headers, timeout=30)
-        if r.status_code != 200 or not r.content:
-            continue
-        body = r.content.lstrip()
-        if fmt == "json3":
-            if body.startswith(b")]}\'\n"):
-                body = body.split(b"\n", 1)[1]
-            if b"\"events\"" in body or b"events" in body:
-                return fmt, r.content
-        else:
-            if b"<p " in body:
-                return fmt, r.content
+    # Hedged probing: request the preferred format first and only start the next one
+    # if it fails or has not answered within CAPTION_HEDGE_DELAY_S. The common case
+    # stays a single timedtext GET (the endpoint rate-limits), while a dead or slow
+    # format no longer costs a full sequential timeout.
+    pool = ThreadPoolExecutor(max_workers=len(prefer))
+    pending: Dict = {}
+    try:
+        for fmt in prefer:
+            pending[pool.submit(_fetch_caption_fmt, base_url, fmt)] = fmt
+            while pending:
+                done, _ = wait(pending, timeout=CAPTION_HEDGE_DELAY_S, return_when=FIRST_COMPLETED)
+                if not done:
+                    break  # still waiting; hedge with the next format
+                for fut in done:
+                    done_fmt = pending.pop(fut)
+                    data = fut.result()
+                    if data:
+                        return done_fmt, data
+        # Every format has been requested; take the first usable answer
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                done_fmt = pending.pop(fut)
+                data = fut.result()
+                if data:
+                    return done_fmt, data
+    finally:
+        # Return without blocking on a slower probe still in flight. It is not
+        # interrupted, though: it runs to completion (bounded by its timeout) and
+        # the interpreter joins it before exiting.
+        pool.shutdown(wait=False, cancel_futures=True)
     raise RuntimeError("No usable caption data")
 
 
-def parse_json3_sentences(data: bytes) -> List[Tuple[float, str]]:
-    obj = json.loads(data.decode("utf-8"))
-    events = obj.get("events") or []
-    out: List[Tuple[float, str]] = []
-    for ev in events:
-        t0 = ev.get("tStartMs")
-        segs = ev.get("segs") or []
-        if t0 is None or not segs:
-            continue
-        text = "".join([(s.get("utf8") or "") for s in segs]).replace("\n", " ").strip()
-        if text:
-            out.append((float(t0) / 1000.0, text))
-    return out
+def _caption_cache_path(video_id: str, fmt: str, lang: str = 'th') -> Path:
+    return CAPTIONS_CACHE_DIR / f"{video_id}.{lang}.{fmt}"
+
+
+def load_cached_caption(video_id: str, prefer: Tuple[str, ...] = ("json3", "srv3")) -> Optional[Tuple[str, bytes]]:
+    """Return (fmt, data) from the on-disk caption cache, or None on a miss."""
+    for fmt in prefer:
+        path = _caption_cache_path(video_id, fmt)
+        if path.exists():
+            return fmt, path.read_bytes()
+    return None
+
+
+def store_cached_caption(video_id: str, fmt: str, data: bytes) -> None:
+    # Captions are immutable per video; write atomically so a crash never leaves a partial entry.
+    # Best-effort: a read-only checkout or full disk must not fail a successful fetch.
+    path = _caption_cache_path(video_id, fmt)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    except OSError:
+        pass
 
 
-def parse_json3_words(data: bytes) -> List[Tuple[float, str]]:
-    obj = json.loads(data.decode("utf-8"))
+def parse_json3_both(data: bytes) -> Tuple[List[Tuple[int, str]], List[Tuple[int, str]]]:
+    """Walk json3 events once, returning (sentences, words)."""
+    obj = _json.loads(data)
     events = obj.get("events") or []
-    out: List[Tuple[float, str]] = []
+    sentences: List[Tuple[int, str]] = []
+    words: List[Tuple[int, str]] = []
+    add_word = words.append
     for ev in events:
         t0 = ev.get("tStartMs")
         segs = ev.get("segs") or []
         if t0 is None or not segs:
             continue
+        start = int(t0)
+        parts: List[str] = []
         for s in segs:
-            token = (s.get("utf8") or "").strip()
+            raw = s.get("utf8") or ""
+            parts.append(raw)
+            token = raw.strip()
             if not token or (token.startswith("[") and token.endswith("]")):
                 continue
-            ts = (int(t0) + int(s.get("tOffsetMs", 0))) / 1000.0
-            out.append((ts, token))
-    return out
-
-
-def parse_srv3_sentences(data: bytes) -> List[Tuple[float, str]]:
-    import xml.etree.ElementTree as ET
-    root = ET.fromstring(data)
-    out: List[Tuple[float, str]] = []
-    for p in root.findall(".//p"):
-        t = p.get("t")
-        if t is None:
-            continue
-        start_ms = int(t)
-        text = "".join([(s.text or "").strip() for s in p.findall("s")]).strip()
+            add_word((start + int(s.get("tOffsetMs", 0)), token))
+        text = "".join(parts).replace("\n", " ").strip()
         if text:
-            out.append((start_ms / 1000.0, text))
-    return out
-
-
-def parse_srv3_words(data: bytes) -> List[Tuple[float, str]]:
-    import xml.etree.ElementTree as ET
-    root = ET.fromstring(data)
-    out: List[Tuple[float, str]] = []
-    for p in root.findall(".//p"):
-        pt = p.get("t")
-        if pt is None:
-            continue
-        base = int(pt)
-        for s in p.findall("s"):
-            txt = (s.text or "").strip()
-            if not txt or (txt.startswith("[") and txt.endswith("]")):
-                continue
-            off = int(s.get("t") or 0)
-            out.append(((base + off) / 1000.0, txt))
-    return out
+            sentences.append((start, text))
+    return sentences, words
+
+
+class _Srv3Handler:
+    """expat callbacks that collect (sentences, words) from srv3 without building elements."""
+
+    def __init__(self) -> None:
+        self.sentences: List[Tuple[int, str]] = []
+        self.words: List[Tuple[int, str]] = []
+        self._base: Optional[int] = None  # start ms of the open <p t=...>
+        self._start: Optional[int] = None  # absolute start ms of the open <s> inside it
+        self._parts: List[str] = []
+        self._buf: List[str] = []
+
+    def start_element(self, name: str, attrs: Dict[str, str]) -> None:
+        if name == "p":
+            t = attrs.get("t")
+            self._base = int(t) if t is not None else None
+            self._parts = []
+        elif name == "s" and self._base is not None:
+            self._start = self._base + int(attrs.get("t") or 0)
+            self._buf = []
+
+    def char_data(self, data: str) -> None:
+        if self._start is not None:
+            self._buf.append(data)
+
+    def end_element(self, name: str) -> None:
+        if name == "s" and self._start is not None:
+            txt = "".join(self._buf).strip()
+            self._parts.append(txt)
+            if txt and not (txt.startswith("[") and txt.endswith("]")):
+                self.words.append((self._start, txt))
+            self._start = None
+        elif name == "p" and self._base is not None:
+            text = "".join(self._parts).strip()
+            if text:
+                self.sentences.append((self._base, text))
+            self._base = None
+
+
+def parse_srv3_both(data: bytes) -> Tuple[List[Tuple[int, str]], List[Tuple[int, str]]]:
+    """Walk srv3 paragraphs once, returning (sentences, words).
+
+    Uses expat callbacks directly, so no element objects are ever allocated.
+    """
+    handler = _Srv3Handler()
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = handler.start_element
+    parser.EndElementHandler = handler.end_element
+    parser.CharacterDataHandler = handler.char_data
+    parser.Parse(data, True)
+    return handler.sentences, handler.words
+
+
+def parse_caption(fmt: str, data: bytes) -> Tuple[List[Tuple[int, str]], List[Tuple[int, str]]]:
+    """Parse caption data once and return (sentences, words)."""
+    if fmt == 'json3':
+        return parse_json3_both(data)
+    return parse_srv3_both(data)
 
 
-def write_pairs(pairs: List[Tuple[float, str]], path: Path) -> None:
-    pairs.sort(key=lambda t: t[0])
+def write_pairs(pairs: List[Tuple[int, str]], path: Path) -> None:
+    # Timestamps are integer ms; format as seconds with 3 decimals without going through float
+    pairs.sort(key=itemgetter(0))
     with path.open('w', encoding='utf-8') as f:
-        for t, s in pairs:
-            f.write(f"{t:.3f}\t{s}\n")
+        f.write("".join([f"{ms // 1000}.{ms % 1000:03d}\t{s}\n" for ms, s in pairs]))
 
 
-def main() -> int:
-    url_or_id = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('TEST_YT_URL', 'https://www.youtube.com/watch?v=1gfdp6V1Epc')
-    vid = extract_video_id(url_or_id)
-
-    # Thai-only pipeline
-    tracks = fetch_captiontracks_via_youtubei(vid, hl='th', gl='TH')
-    if not tracks:
-        print('ERROR: No captionTracks available from youtubei.')
-        return 2
-    track = pick_track(tracks, lang='th')
-    if not track or not track.get('baseUrl'):
-        print('ERROR: Could not select a caption track.')
-        return 3
+def write_lyrics(url_or_id: str, out_dir: Path = OUTPUT_DIR) -> int:
+    """Fetch Thai captions and write sentence/word TSVs into out_dir.
 
-    fmt, data = download_caption(track['baseUrl'], prefer=("json3", "srv3"))
+    Returns a process-style exit code (0 on success).
+    """
+    vid = extract_video_id(url_or_id)
 
-    if fmt == 'json3':
-        sentences = parse_json3_sentences(data)
-        words = parse_json3_words(data)
+    cached = load_cached_caption(vid)
+    if cached:
+        fmt, data = cached
     else:
-        sentences = parse_srv3_sentences(data)
-        words = parse_srv3_words(data)
-
-    out_sent = OUTPUT_DIR / 'youtube_autosubs.sentences.txt'
-    out_words = OUTPUT_DIR / 'youtube_autosubs.words.txt'
+        # Thai-only pipeline
+        tracks = fetch_captiontracks_via_youtubei(vid, hl='th', gl='TH')
+        if not tracks:
+            print('ERROR: No captionTracks available from youtubei.')
+            return 2
+        track = pick_track(tracks, lang='th')
+        if not track or not track.get('baseUrl'):
+            print('ERROR: Could not select a caption track.')
+            return 3
+
+        fmt, data = download_caption(track['baseUrl'], prefer=("json3", "srv3"))
+        store_cached_caption(vid, fmt, data)
+
+    sentences, words = parse_caption(fmt, data)
+
+    out_sent = out_dir / 'youtube_autosubs.sentences.txt'
+    out_words = out_dir / 'youtube_autosubs.words.txt'
     write_pairs(sentences, out_sent)
     write_pairs(words, out_words)
 
@@ -235,5 +346,10 @@ def main() -> int:
     return 0
 
 
+def main() -> int:
+    url_or_id = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('TEST_YT_URL', 'https://www.youtube.com/watch?v=1gfdp6V1Epc')
+    return write_lyrics(url_or_id)
+
+
 if __name__ == '__main__':
     raise SystemExit(main())
@@ -2,6 +2,9 @@ from __future__ import annotations
 
 import os
 import json
+import hashlib
+import tempfile
+from pathlib import Path
 from typing import Optional
 
 import requests
@@ -17,6 +20,14 @@ DEFAULT_MODEL: str = os.environ.get("OPENAI_DEFAULT_MODEL", "openai/gpt-5-chat")
 DEFAULT_TEMPERATURE: float = 0.0
 DEFAULT_MAX_TOKENS: int = 16
 DEFAULT_TIMEOUT_SECONDS: float = 60.0
+# prompt_cache_key is not part of every OpenAI-compatible API and strict servers reject
+# unknown fields, so it is only sent when LLM_PROMPT_CACHE_KEY=1
+SEND_PROMPT_CACHE_KEY: bool = os.environ.get("LLM_PROMPT_CACHE_KEY") == "1"
+
+# Opt-in response cache (LLM_CACHE=1): identical requests are served from disk,
+# with an in-process layer on top for repeat calls within one run.
+CACHE_DIR: Path = Path(__file__).resolve().parents[1] / ".cache" / "llm"
+_MEMO: dict[str, dict] = {}
 
 
 def _headers() -> dict:
@@ -35,8 +46,12 @@ def _headers() -> dict:
     }
 
 
-def query_raw(prompt: str, *, model: Optional[str] = None) -> dict:
-    """Send a single-turn chat completion and return the full JSON response."""
+def query_raw(prompt: str, *, model: Optional[str] = None, prompt_cache_key: Optional[str] = None) -> dict:
+    """Send a single-turn chat completion and return the full JSON response.
+
+    prompt_cache_key is forwarded as-is (only when LLM_PROMPT_CACHE_KEY=1) so providers
+    that support prompt caching can route requests sharing a prompt prefix to the same cache.
+    """
     endpoint = DEFAULT_API_ENDPOINT.rstrip("/") + "/chat/completions"
     chosen_model = model or DEFAULT_MODEL
 
@@ -48,6 +63,21 @@ def query_raw(prompt: str, *, model: Optional[str] = None) -> dict:
         "temperature": DEFAULT_TEMPERATURE,
         "max_tokens": DEFAULT_MAX_TOKENS,
     }
+    if prompt_cache_key and SEND_PROMPT_CACHE_KEY:
+        payload["prompt_cache_key"] = prompt_cache_key
+
+    use_cache = os.environ.get("LLM_CACHE") == "1"
+    if use_cache:
+        # Key on the full request so temperature/max_tokens overrides get separate entries
+        key = hashlib.blake2b(json.dumps([endpoint, payload], sort_keys=True).encode("utf-8"), digest_size=16).hexdigest()
+        if key in _MEMO:
+            return _MEMO[key]
+        cache_path = CACHE_DIR / f"{key}.json"
+        try:
+            _MEMO[key] = json.loads(cache_path.read_text(encoding="utf-8"))
+            return _MEMO[key]
+        except (OSError, ValueError):
+            pass  # missing, unreadable or corrupt entry: treat as a miss
 
     resp = requests.post(
         endpoint,
@@ -59,15 +89,29 @@ def query_raw(prompt: str, *, model: Optional[str] = None) -> dict:
         # Raise with server-provided body for easier debugging
         raise RuntimeError(f"{resp.status_code} Error from LLM API: {resp.text}")
     # For 2xx, parse JSON
-    return resp.json()
-
-
-def query(prompt: str, *, model: Optional[str] = None) -> str:
+    data = resp.json()
+    if use_cache:
+        _MEMO[key] = data
+        # Best-effort: the response is already paid for, so a cache write failure must not lose it.
+        # A unique temp name keeps concurrent writers of the same key from clobbering each other.
+        try:
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=CACHE_DIR, suffix=".tmp", delete=False
+            ) as tmp:
+                tmp.write(json.dumps(data, ensure_ascii=False))
+            os.replace(tmp.name, cache_path)
+        except OSError:
+            pass
+    return data
+
+
+def query(prompt: str, *, model: Optional[str] = None, prompt_cache_key: Optional[str] = None) -> str:
     """Send a single-turn chat completion and return the assistant text content.
 
     Defaults are hard-coded; environment variables can override endpoint/model.
     """
-    data = query_raw(prompt, model=model)
+    data = query_raw(prompt, model=model, prompt_cache_key=prompt_cache_key)
     try:
         content = data["choices"][0]["message"]["content"]
     except Exception:
@@ -1,46 +1,68 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import functools
+import hashlib
 import json
+import logging
 import os
+import secrets
 import sys
 import tempfile
+import threading
 import time
-import subprocess
-import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Dict, Any
-from tqdm import tqdm
-from boto3.s3.transfer import TransferConfig
 
-import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
-from botocore.config import Config
-from dotenv import load_dotenv, find_dotenv
+import requests
+
+# boto3/botocore, tqdm and dotenv are imported inside the functions that use them:
+# together they add hundreds of ms of import time that early-exit paths never need.
 
 
 ROOT = Path(__file__).resolve().parents[1]
 OUTPUT_DIR = ROOT / "output"
 
+# Status lines go to stderr (configured in main()) so stdout stays clean for the
+# final manifest URL; programmatic callers get no output unless they configure logging.
+_LOG = logging.getLogger("upload")
+
+# All asset checks hit the same bucket host, so one pooled connection serves them
+_SESSION = requests.Session()
+
+
+@functools.lru_cache(maxsize=1)
+def _dotenv_path() -> str:
+    # find_dotenv() walks up the tree stat-ing each level; resolve it once per process
+    from dotenv import find_dotenv
+
+    return find_dotenv()
+
 
 def _load_env() -> None:
+    from dotenv import load_dotenv
+
     # Load variables from project .env if present
-    load_dotenv(find_dotenv())
+    load_dotenv(_dotenv_path())
 
 
 def _env_path() -> Path | None:
-    path = find_dotenv()
+    path = _dotenv_path()
     return Path(path) if path else None
 
 
-def _is_var_commented(env_text: str, var_name: str) -> bool:
-    prefix = f"# {var_name}="
-    alt_prefix = f"#{var_name}="
+def _commented_var_names(env_text: str) -> set[str]:
+    """Return names of variables that appear as commented-out assignments (e.g. "# NAME=...")."""
+    names: set[str] = set()
     for line in env_text.splitlines():
         stripped = line.lstrip()
-        if stripped.startswith(prefix) or stripped.startswith(alt_prefix):
-            return True
-    return False
+        if not stripped.startswith("#"):
+            continue
+        name, sep, _ = stripped.lstrip("# ").partition("=")
+        if sep and name:
+            names.add(name)
+    return names
 
 
 def _validate_aws_env() -> dict:
@@ -61,8 +83,9 @@ def _validate_aws_env() -> dict:
             except Exception:
                 env_text = ""
 
+        commented = _commented_var_names(env_text)
         for name in missing:
-            if env_text and _is_var_commented(env_text, name):
+            if name in commented:
                 hints.append(f"- {name} appears commented out in .env. Please uncomment and set a value.")
             else:
                 hints.append(f"- Set {name}=... in your .env file.")
@@ -77,22 +100,32 @@ def _validate_aws_env() -> dict:
 
 
 def _generate_folder_name(prefix: str = "karaoke_") -> str:
-    # Simple unique-ish id: yyyymmdd-hhmmss + short random suffix from time
-    ts = time.strftime("%Y%m%d-%H%M%S")
-    # add milliseconds entropy
-    suffix = str(int((time.time() % 1) * 1000000)).rjust(6, "0")
-    return f"{prefix}{ts}_{suffix}"
+    # Unique id: yyyymmdd-hhmmss + 6 random hex chars (no collisions within the same second)
+    return f"{prefix}{time.strftime('%Y%m%d-%H%M%S')}_{secrets.token_hex(3)}"
 
 
+@functools.lru_cache(maxsize=4)
 def _build_s3_client(aws_access_key_id: str, aws_secret_access_key: str, aws_region: str):
-    timeout_cfg = Config(connect_timeout=20, read_timeout=300, retries={"max_attempts": 3})
-    return boto3.client(
+    # Cached per credentials/region so repeat uploads in one process reuse the client
+    import boto3
+    from botocore.config import Config
+
+    # File workers and multipart threads share this client; size the pool above
+    # botocore's default of 10 so concurrent parts don't churn connections
+    timeout_cfg = Config(
+        connect_timeout=20,
+        read_timeout=300,
+        retries={"max_attempts": 3},
+        max_pool_connections=32,
+    )
+    client = boto3.client(
         "s3",
         aws_access_key_id=aws_access_key_id,
         aws_secret_access_key=aws_secret_access_key,
         region_name=aws_region,
         config=timeout_cfg,
     )
+    return client
 
 
 def _s3_base_url(bucket: str, region: str) -> str:
@@ -103,26 +136,19 @@ def _s3_base_url(bucket: str, region: str) -> str:
     return f"https://{bucket}.s3.{region}.amazonaws.com"
 
 
-def _ensure_prefix_exists(s3_client, bucket: str, prefix: str) -> None:
-    # Create a zero-byte object as a folder marker so the prefix appears in consoles
-    if not prefix.endswith("/"):
-        prefix = prefix + "/"
-    try:
-        s3_client.put_object(Bucket=bucket, Key=prefix)
-    except ClientError as e:
-        code = e.response.get("Error", {}).get("Code")
-        raise RuntimeError(f"Failed to create folder '{prefix}' in bucket '{bucket}': {code}") from e
-
-
 def _rewrite_manifest_with_absolute_urls(
     manifest: Dict[str, Any],
     base_http_url: str,
     folder_prefix: str,
+    asset_keys: Dict[str, str],
 ) -> Dict[str, Any]:
     # base_http_url like https://bucket.s3.region.amazonaws.com
-    # folder_prefix like karaoke_20240101-010101_123456
+    # folder_prefix like karaoke_20240101-010101_a1b2c3
+    # asset_keys maps local file names to the S3 keys they were uploaded under
     def to_url(rel: str) -> str:
-        key = f"{folder_prefix}/{rel}" if not rel.startswith("/") else f"{folder_prefix}{rel}"
+        key = asset_keys.get(rel.lstrip("/"))
+        if not key:
+            key = f"{folder_prefix}/{rel}" if not rel.startswith("/") else f"{folder_prefix}{rel}"
         return f"{base_http_url}/{key}"
 
     result = dict(manifest)  # shallow copy
@@ -134,14 +160,65 @@ def _rewrite_manifest_with_absolute_urls(
     return result
 
 
-def _upload_with_progress(s3, local_path: Path, bucket: str, key: str, *, extra_args: dict | None = None) -> None:
-    size = local_path.stat().st_size
+def _file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _remote_exists(s3, bucket: str, key: str, *, size: int) -> bool:
+    """Return True if s3://bucket/key is already present with the expected size."""
+    from botocore.exceptions import ClientError
+
+    try:
+        head = s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        # Without s3:ListBucket, S3 answers HEAD on a missing key with 403 instead of 404,
+        # so both mean "not there yet"; throttling, 5xx and other errors propagate
+        code = str(e.response.get("Error", {}).get("Code", ""))
+        if code in {"404", "NoSuchKey", "NotFound", "403"}:
+            return False
+        raise
+    # The key is the content hash, so a same-size object is the same bytes
+    return head.get("ContentLength") == size
+
+
+def _upload_asset(
+    s3, path: Path, size: int, bucket: str, key: str, *, extra_args: dict, show_progress: bool = True
+) -> None:
+    if _remote_exists(s3, bucket, key, size=size):
+        _LOG.info("Unchanged, skipping %s (s3://%s/%s)", path, bucket, key)
+        return
+    _LOG.info("Uploading %s -> s3://%s/%s", path, bucket, key)
+    _upload_with_progress(s3, path, size, bucket, key, extra_args=extra_args, show_progress=show_progress)
+
+
+def _upload_with_progress(
+    s3,
+    local_path: Path,
+    size: int,
+    bucket: str,
+    key: str,
+    *,
+    extra_args: dict | None = None,
+    show_progress: bool = True,
+) -> None:
+    from boto3.s3.transfer import TransferConfig
+
     transfer_cfg = TransferConfig(
-        multipart_threshold=64 * 1024,   # 64KB threshold
-        multipart_chunksize=64 * 1024,   # 64KB parts
-        max_concurrency=1,               # simplest, serial callbacks
-        use_threads=False,
+        multipart_threshold=8 * 1024 * 1024,   # 8MB threshold
+        multipart_chunksize=8 * 1024 * 1024,   # 8MB parts
+        max_concurrency=10,                    # parts upload in parallel
+        use_threads=True,
     )
+    if not show_progress:
+        s3.upload_file(str(local_path), bucket, key, ExtraArgs=(extra_args or {}), Config=transfer_cfg)
+        return
+
+    from tqdm import tqdm
+
     with tqdm(
         total=size,
         desc=local_path.name,
@@ -151,8 +228,12 @@ def _upload_with_progress(s3, local_path: Path, bucket: str, key: str, *, extra_
         leave=False,
         file=sys.stderr,
     ) as pbar:
+        # Callbacks arrive from the transfer threads; serialize progress updates
+        lock = threading.Lock()
+
         def _cb(n: int) -> None:
-            pbar.update(n)
+            with lock:
+                pbar.update(n)
 
         s3.upload_file(
             str(local_path),
@@ -164,68 +245,42 @@ def _upload_with_progress(s3, local_path: Path, bucket: str, key: str, *, extra_
         )
 
 
-def _curl_verify(url: str) -> None:
-    if not shutil.which("curl"):
-        sys.stderr.write("curl not found; skipping public access check.\n")
-        sys.stderr.flush()
-        return
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".json")
-    tmp_path = tmp.name
-    tmp.close()
-    try:
-        completed = subprocess.run(
-            ["curl", "-sS", "-L", "-o", tmp_path, "-w", "%{http_code}", url],
-            capture_output=True,
-            text=True,
-        )
-        http_code = (completed.stdout or "").strip()
-        if http_code == "200":
-            print(f"✅ Publicly accessible (HTTP 200). Saved to: {tmp_path}")
-        else:
-            print(f"❌ Not publicly accessible (HTTP {http_code}).")
-    finally:
-        # Keep the file for debugging on success; remove on failure to avoid clutter
-        pass
+def _http_verify(url: str) -> None:
+    # Status line is all we need; HEAD avoids transferring the body
+    http_code, _ = _http_headers(url, method="HEAD")
+    if http_code == 0:
+        print("❌ Not publicly accessible (request failed).")
+    elif http_code == 200:
+        print("✅ Publicly accessible (HTTP 200).")
+    else:
+        print(f"❌ Not publicly accessible (HTTP {http_code}).")
 
 
-def _curl_headers(
+def _http_headers(
     url: str,
     *,
     extra_headers: dict[str, str] | None = None,
     method: str = "HEAD",
 ) -> tuple[int, dict[str, str]]:
-    """Return (status_code, headers) using curl for reliability and parity with CLI checks.
+    """Return (status_code, headers) over a shared keep-alive session.
 
     Follows redirects and returns the final response headers. Header keys are lower-cased.
+    Returns (0, {}) if the request itself fails.
     """
-    if not shutil.which("curl"):
+    try:
+        # stream=True so a GET never downloads the body; we only need headers
+        resp = _SESSION.request(
+            method,
+            url,
+            headers=extra_headers or {},
+            allow_redirects=True,
+            timeout=10,
+            stream=True,
+        )
+    except requests.RequestException:
         return (0, {})
-    cmd: list[str] = ["curl", "-sS", "-D", "-", "-o", "/dev/null", "-L"]
-    if method.upper() == "HEAD":
-        cmd.append("-I")
-    if extra_headers:
-        for k, v in extra_headers.items():
-            cmd.extend(["-H", f"{k}: {v}"])
-    cmd.append(url)
-    completed = subprocess.run(cmd, capture_output=True, text=True)
-    raw = completed.stdout
-    status_code = 0
-    headers: dict[str, str] = {}
-    # Parse the last header block (after redirects)
-    for line in raw.splitlines():
-        line = line.strip("\r\n")
-        if not line:
-            continue
-        if line.startswith("HTTP/"):
-            parts = line.split()
-            if len(parts) >= 2 and parts[1].isdigit():
-                status_code = int(parts[1])
-            headers = {}
-            continue
-        if ":" in line:
-            k, v = line.split(":", 1)
-            headers[k.strip().lower()] = v.strip()
-    return status_code, headers
+    with resp:
+        return resp.status_code, {k.lower(): v for k, v in resp.headers.items()}
 
 
 def _normalize_content_type(value: str) -> str:
@@ -240,17 +295,26 @@ def _check_s3_asset(
 ) -> list[str]:
     """Run a set of header-level validations against an S3-hosted asset.
 
-    - Verifies Content-Type via HEAD
-    - Verifies CORS (Access-Control-Allow-Origin) presence for HEAD with Origin
+    - Verifies Content-Type and CORS (Access-Control-Allow-Origin) from one HEAD with Origin
     - Verifies Range support (206 + Content-Range for Range: bytes=0-1)
-    Returns a list of human-readable issue strings.
+    Both HEADs are sent concurrently. Returns a list of human-readable issue strings.
     """
     issues: list[str] = []
 
-    # Basic HEAD
-    status, headers = _curl_headers(url, method="HEAD")
+    # HEAD with Origin (Content-Type + CORS) and HEAD with Range, in parallel
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        head_fut = pool.submit(_http_headers, url, extra_headers={"Origin": origin}, method="HEAD")
+        range_fut = pool.submit(
+            _http_headers,
+            url,
+            extra_headers={"Origin": origin, "Range": "bytes=0-1"},
+            method="HEAD",
+        )
+        status, headers = head_fut.result()
+        status_r, headers_r = range_fut.result()
+
     if status == 0 and not headers:
-        issues.append("curl not found; cannot perform header checks")
+        issues.append(f"Request failed for {url}; cannot perform header checks")
         return issues
     ct = _normalize_content_type(headers.get("content-type", ""))
     if ct not in [et.lower() for et in expected_types]:
@@ -258,20 +322,14 @@ def _check_s3_asset(
             f"Wrong Content-Type '{headers.get('content-type', '')}' for {url} (expected one of: {', '.join(expected_types)})"
         )
 
-    # CORS on HEAD with Origin
-    status_o, headers_o = _curl_headers(url, extra_headers={"Origin": origin}, method="HEAD")
-    allow_origin = headers_o.get("access-control-allow-origin")
+    # CORS on the same HEAD with Origin
+    allow_origin = headers.get("access-control-allow-origin")
     if allow_origin not in ("*", origin):
         issues.append(
             f"Missing or invalid Access-Control-Allow-Origin for {url} on HEAD with Origin (got: {allow_origin!r})"
         )
 
     # Range request (HEAD with Range works on S3; expect 206 + Content-Range)
-    status_r, headers_r = _curl_headers(
-        url,
-        extra_headers={"Origin": origin, "Range": "bytes=0-1"},
-        method="HEAD",
-    )
     content_range = headers_r.get("content-range", "")
     if status_r != 206 or not content_range.startswith("bytes 0-1/"):
         issues.append(
@@ -281,11 +339,12 @@ def _check_s3_asset(
     return issues
 
 
-def upload_output_and_get_manifest() -> tuple[str, dict]:
+def upload_output_and_get_manifest(*, show_progress: bool = True) -> tuple[str, dict]:
     """Upload files under output/ to S3 and return (manifest_url, rewritten_manifest).
 
     This function performs the same upload work as the CLI, but returns values
     for programmatic use. Caller is responsible for any post-upload validation.
+    Pass show_progress=False to suppress the tqdm progress bars on stderr.
     Raises on errors.
     """
     _load_env()
@@ -302,13 +361,33 @@ def upload_output_and_get_manifest() -> tuple[str, dict]:
         env_vals["AWS_REGION"],
     )
 
+    # S3 has no real folders; the uploaded keys alone make the prefix exist
     folder = _generate_folder_name("karaoke_")
-    _ensure_prefix_exists(s3, bucket, folder)
 
     base_http = _s3_base_url(bucket, region)
 
-    # Collect files under output/
-    local_files: list[Path] = [p for p in OUTPUT_DIR.iterdir() if p.is_file()]
+    # Collect files under output/ with their sizes from a single scandir pass
+    with os.scandir(OUTPUT_DIR) as it:
+        local_files: list[tuple[Path, int]] = [(Path(e.path), e.stat().st_size) for e in it if e.is_file()]
+
+    # Data files go under a content-addressed key, so re-runs with unchanged files
+    # find them already on S3 and skip the upload, and the bytes behind a key never
+    # change, so clients may cache them forever; only the manifest is per-run.
+    uploads: list[tuple[Path, int, str, dict]] = []
+    for path, size in local_files:
+        if path.name == "manifest.json":
+            continue
+        sha = _file_sha256(path)
+        key = f"by-sha256/{sha[:2]}/{sha}{path.suffix}"
+
+        # Set appropriate ContentType based on file extension
+        extra_args = {"CacheControl": "public, max-age=31536000, immutable"}
+        if path.suffix.lower() == ".mp3":
+            extra_args["ContentType"] = "audio/mpeg"
+        elif path.suffix.lower() in {".txt", ".tsv"}:
+            extra_args["ContentType"] = "text/plain"
+
+        uploads.append((path, size, key, extra_args))
 
     # Load local manifest.json so we can rewrite a temp copy with absolute URLs
     local_manifest_path = OUTPUT_DIR / "manifest.json"
@@ -317,41 +396,36 @@ def upload_output_and_get_manifest() -> tuple[str, dict]:
     with local_manifest_path.open("r", encoding="utf-8") as f:
         manifest = json.load(f)
 
-    rewritten = _rewrite_manifest_with_absolute_urls(manifest, base_http, folder)
+    asset_keys = {path.name: key for path, _, key, _ in uploads}
+    rewritten = _rewrite_manifest_with_absolute_urls(manifest, base_http, folder, asset_keys)
 
     # Create temp file for manifest
     temp_manifest_path = Path(tempfile.gettempdir()) / f"manifest_{folder}.json"
-    with temp_manifest_path.open("w", encoding="utf-8") as f:
-        json.dump(rewritten, f, ensure_ascii=False, indent=2)
-
-    # Upload all files first, excluding manifest.json; we'll upload temp manifest last
-    for path in local_files:
-        if path.name == "manifest.json":
-            continue
-        key = f"{folder}/{path.name}"
-        # Status to stderr so stdout remains clean for the final manifest URL
-        sys.stderr.write(f"Uploading {path} -> s3://{bucket}/{key}\n")
-        sys.stderr.flush()
-
-        # Set appropriate ContentType based on file extension
-        extra_args = {}
-        if path.suffix.lower() == ".mp3":
-            extra_args["ContentType"] = "audio/mpeg"
-        elif path.suffix.lower() in {".txt", ".tsv"}:
-            extra_args["ContentType"] = "text/plain"
-
-        _upload_with_progress(s3, path, bucket, key, extra_args=extra_args)
+    manifest_bytes = json.dumps(rewritten, ensure_ascii=False, indent=2).encode("utf-8")
+    temp_manifest_path.write_bytes(manifest_bytes)
+
+    # Upload all files first (concurrently), excluding manifest.json; we'll upload temp manifest last
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [
+            pool.submit(
+                _upload_asset, s3, path, size, bucket, key, extra_args=extra_args, show_progress=show_progress
+            )
+            for path, size, key, extra_args in uploads
+        ]
+        for fut in as_completed(futures):
+            fut.result()
 
     # Upload rewritten manifest
     manifest_key = f"{folder}/manifest.json"
-    sys.stderr.write(f"Uploading manifest -> s3://{bucket}/{manifest_key}\n")
-    sys.stderr.flush()
+    _LOG.info("Uploading manifest -> s3://%s/%s", bucket, manifest_key)
     _upload_with_progress(
         s3,
         temp_manifest_path,
+        len(manifest_bytes),
         bucket,
         manifest_key,
         extra_args={"ContentType": "application/json"},
+        show_progress=show_progress,
     )
 
     # Remove temp manifest
@@ -365,51 +439,46 @@ def upload_output_and_get_manifest() -> tuple[str, dict]:
 
 
 def main() -> int:
-    try:
-        # Early checks to preserve historical exit codes
-        if not OUTPUT_DIR.exists() or not OUTPUT_DIR.is_dir():
-            print(f"Error: output directory not found at {OUTPUT_DIR}")
-            return 2
-        local_manifest_path = OUTPUT_DIR / "manifest.json"
-        if not local_manifest_path.exists():
-            print(f"Error: manifest not found at {local_manifest_path}")
-            return 3
+    logging.basicConfig(stream=sys.stderr, format="%(message)s", level=logging.INFO)
 
+    # Early checks to preserve historical exit codes
+    if not OUTPUT_DIR.exists() or not OUTPUT_DIR.is_dir():
+        print(f"Error: output directory not found at {OUTPUT_DIR}")
+        return 2
+    local_manifest_path = OUTPUT_DIR / "manifest.json"
+    if not local_manifest_path.exists():
+        print(f"Error: manifest not found at {local_manifest_path}")
+        return 3
+
+    # Only needed once an upload is actually attempted
+    from botocore.exceptions import ClientError, NoCredentialsError
+
+    try:
         manifest_url, rewritten = upload_output_and_get_manifest()
 
         print(f"\nManifest URL: {manifest_url}")
-        _curl_verify(manifest_url)
+        _http_verify(manifest_url)
 
-        # Additional validation: check audio and text assets directly on S3 using curl header analysis
+        # Additional validation: check audio and text assets directly on S3 using header analysis
         problems: list[str] = []
+        checks: list[tuple[str, list[str]]] = []
         audio_url = rewritten.get("audio_file")
         words_url = rewritten.get("words")
         sentences_url = rewritten.get("sentences")
 
         if isinstance(audio_url, str) and audio_url:
-            problems += _check_s3_asset(
-                audio_url,
-                expected_types=[
-                    "audio/mpeg",
-                    "audio/mp3",
-                ],
-            )
+            checks.append((audio_url, ["audio/mpeg", "audio/mp3"]))
 
         if isinstance(words_url, str) and words_url:
-            problems += _check_s3_asset(
-                words_url,
-                expected_types=[
-                    "text/plain",
-                ],
-            )
+            checks.append((words_url, ["text/plain"]))
 
         if isinstance(sentences_url, str) and sentences_url:
-            problems += _check_s3_asset(
-                sentences_url,
-                expected_types=[
-                    "text/plain",
-                ],
-            )
+            checks.append((sentences_url, ["text/plain"]))
+
+        # Assets are independent; check them concurrently (results keep asset order)
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            for issues in pool.map(lambda c: _check_s3_asset(c[0], expected_types=c[1]), checks):
+                problems += issues
 
         if problems:
             print("Validation issues detected:")